@@ -5,17 +5,35 @@ Enhanced with Service Catalog, PDF Generation, and PostgreSQL Support
 """
 
 import sqlite3
+import json
 import os
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file
+import math
+import time
+import hashlib
+import copy
+import contextlib
+import functools
+import threading
+import queue
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, render_template, request, redirect, url_for, send_file, g, stream_with_context
 from datetime import datetime
 from io import BytesIO
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import BaseDocTemplate, PageTemplate, Frame, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 
+# orjson serializes the catalog API much faster; the stdlib json module is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 app = Flask(__name__)
 
 # Database Configuration - Auto-detect PostgreSQL or use SQLite
@@ -38,9 +56,30 @@ else:
 
 app.config['DATABASE'] = 'database.db'
 
+# DELETE ... RETURNING needs SQLite 3.35+. Python on Linux links the system SQLite library,
+# which can be older than that on long-term-support distributions.
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Idle SQLite connections shared by all request threads. A thread-local connection would
+# be thrown away with every thread the dev server spawns per request; a pool survives them.
+# Connections are opened with check_same_thread=False so any thread may borrow one.
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 8))
+_sqlite_pool = queue.LifoQueue(maxsize=SQLITE_POOL_SIZE)
+
+# Applied once to every new SQLite connection after switching it to WAL, which lets readers
+# run alongside the writer. synchronous=NORMAL drops the fsync on every commit, and the
+# 256MB mmap / 64MB page cache serve reads straight from memory.
+SQLITE_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+)
+
 # Database helper functions
 def get_db_connection():
-    """Get database connection - PostgreSQL or SQLite"""
+    """Open a new database connection - PostgreSQL or SQLite"""
     if USE_POSTGRESQL:
         import psycopg2
         import psycopg2.extras
@@ -50,12 +89,158 @@ def get_db_connection():
         return conn
     else:
         # SQLite for local development
-        conn = sqlite3.connect(app.config['DATABASE'])
+        conn = sqlite3.connect(app.config['DATABASE'], check_same_thread=False, cached_statements=512)
         conn.row_factory = sqlite3.Row  # Access columns by name
+        # SQLite keeps the old journal mode when WAL isn't possible (e.g. read-only storage)
+        journal_mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if journal_mode != 'wal':
+            print(f"⚠️ SQLite WAL mode unavailable, using {journal_mode} journal")
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
         return conn
 
+def get_db():
+    """Get the connection for the current request (opened lazily, released on teardown)"""
+    if 'db' not in g:
+        if USE_POSTGRESQL:
+            g.db = get_db_connection()
+        else:
+            # Borrow an idle SQLite connection instead of reconnecting per request
+            try:
+                g.db = _sqlite_pool.get_nowait()
+            except queue.Empty:
+                g.db = get_db_connection()
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exception):
+    """Release the request's connection - SQLite connections go back to the pool"""
+    conn = g.pop('db', None)
+    if conn is None:
+        return
+    if USE_POSTGRESQL:
+        conn.close()
+        return
+    if conn.in_transaction:
+        # Never hand an unfinished transaction to the next request
+        conn.rollback()
+    try:
+        _sqlite_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def tuple_cursor(conn):
+    """Get a cursor that returns plain tuples instead of sqlite3.Row objects"""
+    cursor = conn.cursor()
+    if not USE_POSTGRESQL:
+        cursor.row_factory = None
+    return cursor
+
+@contextlib.contextmanager
+def read_transaction(conn):
+    """Run several reads against one consistent snapshot of the database"""
+    if USE_POSTGRESQL:
+        yield
+        return
+    # sqlite3 doesn't open transactions for SELECTs by itself, so ask for one explicitly
+    conn.execute('BEGIN')
+    try:
+        yield
+    finally:
+        conn.rollback()
+
+# Bump whenever init_db gains a new migration step (and update user_version in database.sql)
+SCHEMA_VERSION = 7
+
+# Triggers keeping customers.total_charges / total_received in step with the services and
+# payments tables, so bills read the totals from the customer row instead of summing rows.
+# Totals are stored unrounded: rounding each step would let them drift from the row sums.
+LEDGER_TOTAL_TRIGGER_NAMES = (
+    'trg_services_insert', 'trg_services_delete', 'trg_services_update',
+    'trg_payments_insert', 'trg_payments_delete', 'trg_payments_update',
+)
+LEDGER_TOTAL_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS trg_services_insert AFTER INSERT ON services BEGIN
+        UPDATE customers SET total_charges = total_charges + NEW.charge WHERE id = NEW.customer_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_services_delete AFTER DELETE ON services BEGIN
+        UPDATE customers SET total_charges = total_charges - OLD.charge WHERE id = OLD.customer_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_services_update AFTER UPDATE OF charge, customer_id ON services BEGIN
+        UPDATE customers SET total_charges = total_charges - OLD.charge WHERE id = OLD.customer_id;
+        UPDATE customers SET total_charges = total_charges + NEW.charge WHERE id = NEW.customer_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_payments_insert AFTER INSERT ON payments BEGIN
+        UPDATE customers SET total_received = total_received + NEW.amount WHERE id = NEW.customer_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_payments_delete AFTER DELETE ON payments BEGIN
+        UPDATE customers SET total_received = total_received - OLD.amount WHERE id = OLD.customer_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_payments_update AFTER UPDATE OF amount, customer_id ON payments BEGIN
+        UPDATE customers SET total_received = total_received - OLD.amount WHERE id = OLD.customer_id;
+        UPDATE customers SET total_received = total_received + NEW.amount WHERE id = NEW.customer_id;
+    END""",
+)
+
+# Triggers rejecting amounts that aren't numbers. REAL affinity already turns numeric
+# strings into REALs, so these only stop text such as '' from being stored, which would
+# otherwise be summed as 0 and re-parsed on every read.
+AMOUNT_TYPE_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS trg_services_charge_insert BEFORE INSERT ON services
+    WHEN typeof(NEW.charge) NOT IN ('real', 'integer') BEGIN
+        SELECT RAISE(ABORT, 'services.charge must be a number');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_services_charge_update BEFORE UPDATE OF charge ON services
+    WHEN typeof(NEW.charge) NOT IN ('real', 'integer') BEGIN
+        SELECT RAISE(ABORT, 'services.charge must be a number');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_payments_amount_insert BEFORE INSERT ON payments
+    WHEN typeof(NEW.amount) NOT IN ('real', 'integer') BEGIN
+        SELECT RAISE(ABORT, 'payments.amount must be a number');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_payments_amount_update BEFORE UPDATE OF amount ON payments
+    WHEN typeof(NEW.amount) NOT IN ('real', 'integer') BEGIN
+        SELECT RAISE(ABORT, 'payments.amount must be a number');
+    END""",
+)
+
+# Amount columns that older versions stored straight from the form, so they can hold text
+TEXT_AMOUNT_COLUMNS = (
+    ('services', 'charge'),
+    ('payments', 'amount'),
+    ('customers', 'loan_amount'),
+)
+
+# Default services seeded into a new service catalog (same list as database.sql)
+SEED_ROWS = (
+    ('Xerox', 0),
+    ('ITR', 0),
+    ('Search Report', 0),
+    ('Valuation Report', 0),
+    ('Plan Design & Estimate', 0),
+    ('Rubber Stamp', 0),
+    ('Agreement', 0),
+    ('Typing', 0),
+    ('Data Entry', 0),
+    ('Stamp Duty', 0),
+    ('Aadhaar-PAN Colour Xerox', 0),
+    ('7/12', 0),
+    ('Guarantor for Mortgage', 0),
+    ('Affidavit', 0),
+    ('Vendor Fee', 0),
+    ('Dast Xerox', 0),
+    ('Consultancy Charge (2%)', 0),
+)
+
+SQL_SEED_CATALOG_SERVICE = 'INSERT OR IGNORE INTO service_catalog (service_name, default_charge) VALUES (?, ?)'
+
+def get_schema_version(conn):
+    """Read the schema version recorded by init_db (0 if none has been recorded yet)"""
+    # user_version is an integer in the database header, so this reads no tables at all
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
 def init_db():
-    """Initialize database from schema file"""
+    """Initialize database from schema file and apply any pending migrations"""
     if not os.path.exists(app.config['DATABASE']):
         conn = get_db_connection()
         with open('database.sql', 'r', encoding='utf-8') as f:
@@ -63,101 +248,283 @@ def init_db():
         conn.commit()
         conn.close()
         print("✓ Database initialized successfully")
-    else:
-        # Migrate existing database to add new tables/columns
-        conn = get_db_connection()
-        try:
-            # Check if service_catalog table exists
-            result = conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name='service_catalog'"
-            ).fetchone()
-            
-            if not result:
-                print("🔄 Migrating database to add service catalog...")
-                conn.executescript("""
+    
+    # Migrate database to add new tables/columns
+    conn = get_db_connection()
+    try:
+        # A single read of the stored version replaces every probe below once the schema is current
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return
+        
+        # Check if service_catalog table exists
+        result = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='service_catalog'"
+        ).fetchone()
+        
+        if not result:
+            print("🔄 Migrating database to add service catalog...")
+            # Plain execute() calls go through the statement cache, unlike executescript()
+            with conn:
+                conn.execute("""
                     CREATE TABLE IF NOT EXISTS service_catalog (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         service_name TEXT NOT NULL UNIQUE,
                         default_charge REAL DEFAULT 0,
                         is_active INTEGER DEFAULT 1,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                    
-                    CREATE INDEX IF NOT EXISTS idx_service_catalog_active ON service_catalog(is_active);
-                    
-                    INSERT OR IGNORE INTO service_catalog (service_name, default_charge) VALUES
-                        ('Xerox', 0),
-                        ('ITR', 0),
-                        ('Search Report', 0),
-                        ('Valuation Report', 0),
-                        ('Plan Design & Estimate', 0),
-                        ('Rubber Stamp', 0),
-                        ('Agreement', 0),
-                        ('Typing', 0),
-                        ('Data Entry', 0),
-                        ('Stamp Duty', 0),
-                        ('Aadhaar-PAN Colour Xerox', 0),
-                        ('7/12', 0),
-                        ('Guarantor for Mortgage', 0),
-                        ('Affidavit', 0),
-                        ('Vendor Fee', 0),
-                        ('Dast Xerox', 0),
-                        ('Consultancy Charge (2%)', 0);
+                    )
                 """)
-                conn.commit()
-                print("✓ Service catalog added successfully")
-            
-            # Check if customer_date column exists
-            cursor = conn.execute("PRAGMA table_info(customers)")
-            columns = [col[1] for col in cursor.fetchall()]
-            if 'customer_date' not in columns:
-                print("🔄 Adding customer_date column...")
-                conn.execute("ALTER TABLE customers ADD COLUMN customer_date DATE")
-                conn.commit()
-                print("✓ Customer date field added successfully")
-            
-            # Check if business_name column exists
-            cursor = conn.execute("PRAGMA table_info(customers)")
-            columns = [col[1] for col in cursor.fetchall()]
-            if 'business_name' not in columns:
-                print("🔄 Adding business_name column...")
-                conn.execute("ALTER TABLE customers ADD COLUMN business_name TEXT")
-                conn.commit()
-                print("✓ Business name field added successfully")
-            
-            # Check if email column exists
-            cursor = conn.execute("PRAGMA table_info(customers)")
-            columns = [col[1] for col in cursor.fetchall()]
-            if 'email' not in columns:
-                print("🔄 Adding email column...")
-                conn.execute("ALTER TABLE customers ADD COLUMN email TEXT")
-                conn.commit()
-                print("✓ Email field added successfully")
-            
-            # Add indexes for customer search performance
-            try:
-                print("🔄 Adding customer search indexes...")
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name)")
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_mobile ON customers(mobile)")
-                conn.commit()
-                print("✓ Customer search indexes added successfully")
-            except Exception as idx_error:
-                print(f"⚠️  Index creation note: {idx_error}")
-                
-        except Exception as e:
-            print(f"⚠️  Migration note: {e}")
-        finally:
-            conn.close()
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_service_catalog_active ON service_catalog(is_active)")
+                conn.executemany(SQL_SEED_CATALOG_SERVICE, SEED_ROWS)
+            print("✓ Service catalog added successfully")
+        
+        # Read the customers columns once for all column checks below
+        columns = [col[1] for col in conn.execute("PRAGMA table_info(customers)").fetchall()]
+        
+        # Check if customer_date column exists
+        if 'customer_date' not in columns:
+            print("🔄 Adding customer_date column...")
+            conn.execute("ALTER TABLE customers ADD COLUMN customer_date DATE")
+            conn.commit()
+            print("✓ Customer date field added successfully")
+        
+        # Check if business_name column exists
+        if 'business_name' not in columns:
+            print("🔄 Adding business_name column...")
+            conn.execute("ALTER TABLE customers ADD COLUMN business_name TEXT")
+            conn.commit()
+            print("✓ Business name field added successfully")
+        
+        # Check if email column exists
+        if 'email' not in columns:
+            print("🔄 Adding email column...")
+            conn.execute("ALTER TABLE customers ADD COLUMN email TEXT")
+            conn.commit()
+            print("✓ Email field added successfully")
+        
+        # Add indexes for customer search performance
+        try:
+            print("🔄 Adding customer search indexes...")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_mobile ON customers(mobile)")
+            # Serves the newest-first home page list without a sort step
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_created_desc ON customers(created_at DESC, id DESC)")
+            conn.commit()
+            print("✓ Customer search indexes added successfully")
+        except Exception as idx_error:
+            print(f"⚠️  Index creation note: {idx_error}")
+        
+        # Add indexes for per-customer ledger lookups
+        try:
+            print("🔄 Adding ledger lookup indexes...")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_services_customer ON services(customer_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_customer_date ON payments(customer_id, date)")
+            # (customer_id, date) already serves every customer_id lookup
+            conn.execute("DROP INDEX IF EXISTS idx_payments_customer")
+            conn.commit()
+            print("✓ Ledger lookup indexes added successfully")
+        except Exception as idx_error:
+            print(f"⚠️  Index creation note: {idx_error}")
+        
+        # Convert amounts stored as text by older versions (e.g. '' from a blank loan amount),
+        # then guard against new ones. Every rewrite is logged with its original text, and
+        # text that isn't a clean number (e.g. '1,500') stops the migration instead of being
+        # coerced, so it can be corrected by hand first.
+        print("🔄 Installing amount type checks...")
+        text_amounts = [
+            (table, column, row_id, value, parse_amount(value))
+            for table, column in TEXT_AMOUNT_COLUMNS
+            for row_id, value in conn.execute(
+                f"SELECT id, {column} FROM {table} WHERE typeof({column}) = 'text'"
+            ).fetchall()
+        ]
+        unparsed = [entry for entry in text_amounts if entry[4] is None]
+        if unparsed:
+            for table, column, row_id, value, _ in unparsed:
+                print(f"❌ {table}.{column} for id {row_id} is not a number: {value!r}")
+            raise ValueError(f"{len(unparsed)} stored amount(s) are not numbers - correct them and restart")
+        with conn:
+            for table, column, row_id, value, amount in text_amounts:
+                print(f"⚠️  Converting {table}.{column} for id {row_id} from {value!r} to {amount}")
+                conn.execute(f"UPDATE {table} SET {column} = ? WHERE id = ?", (amount, row_id))
+            for trigger in AMOUNT_TYPE_TRIGGERS:
+                conn.execute(trigger)
+        print("✓ Amount type checks installed successfully")
+        
+        # Check if the cached ledger total columns exist
+        if 'total_charges' not in columns:
+            print("🔄 Adding ledger total columns...")
+            conn.execute("ALTER TABLE customers ADD COLUMN total_charges REAL NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE customers ADD COLUMN total_received REAL NOT NULL DEFAULT 0")
+            conn.commit()
+            print("✓ Ledger total columns added successfully")
+        
+        # Recalculate the cached totals and (re)install the triggers that maintain them
+        print("🔄 Installing ledger total triggers...")
+        with conn:
+            conn.execute("""
+                UPDATE customers SET
+                    total_charges = (SELECT COALESCE(SUM(charge), 0) FROM services WHERE customer_id = customers.id),
+                    total_received = (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE customer_id = customers.id)
+            """)
+            # Drop first so databases with older trigger definitions pick up the current ones
+            for name in LEDGER_TOTAL_TRIGGER_NAMES:
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            for trigger in LEDGER_TOTAL_TRIGGERS:
+                conn.execute(trigger)
+        print("✓ Ledger total triggers installed successfully")
+        
+        # Record the schema version so the next start can skip all of the checks above
+        with conn:
+            # Older databases kept the version in a schema_meta table
+            conn.execute("DROP TABLE IF EXISTS schema_meta")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION:d}")
+        print(f"✓ Database schema is at version {SCHEMA_VERSION}")
+    except Exception as e:
+        print(f"⚠️  Migration note: {e}")
+    finally:
+        conn.close()
+
+# Customers listed per page on the home page
+CUSTOMERS_PER_PAGE = 50
+
+# SQL statements used by the routes. Keeping each statement as one constant means
+# every call passes identical text, so sqlite3's statement cache can reuse it
+# Customer list pages render every row twice (table and mobile cards), so they must be
+# materialized - select only the columns the list templates show to keep each row small
+CUSTOMER_LIST_COLUMNS = 'id, name, mobile, business_name, village, bank_name, loan_amount'
+SQL_CUSTOMERS_BY_NEWEST = (
+    f'SELECT {CUSTOMER_LIST_COLUMNS} FROM customers ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?'
+)
+SQL_COUNT_CUSTOMERS = 'SELECT COUNT(*) FROM customers'
+SQL_CUSTOMERS_BY_NAME = f'SELECT {CUSTOMER_LIST_COLUMNS} FROM customers ORDER BY name'
+SQL_SEARCH_CUSTOMERS = f'SELECT {CUSTOMER_LIST_COLUMNS} FROM customers WHERE name LIKE ? OR mobile LIKE ? ORDER BY name'
+SQL_CUSTOMER_BY_ID = 'SELECT * FROM customers WHERE id = ?'
+SQL_CUSTOMER_NAME_BY_ID = 'SELECT name FROM customers WHERE id = ?'
+SQL_INSERT_CUSTOMER = (
+    'INSERT INTO customers (name, mobile, email, business_name, village, bank_name, loan_amount, customer_date) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+)
+SQL_DELETE_CUSTOMER = 'DELETE FROM customers WHERE id = ?'
+
+SQL_CATALOG_ALL = 'SELECT * FROM service_catalog ORDER BY service_name'
+# Aliased to the /api/services field names so rows serialize without remapping
+SQL_CATALOG_ACTIVE = (
+    'SELECT id, service_name AS name, default_charge AS charge '
+    'FROM service_catalog WHERE is_active = 1 ORDER BY service_name'
+)
+SQL_INSERT_CATALOG_SERVICE = 'INSERT INTO service_catalog (service_name, default_charge) VALUES (?, ?)'
+SQL_UPDATE_CATALOG_SERVICE = 'UPDATE service_catalog SET default_charge = ?, is_active = ? WHERE id = ?'
+
+SQL_SERVICES_FOR_CUSTOMER = 'SELECT id, service_name, charge, created_at FROM services WHERE customer_id = ?'
+SQL_INSERT_SERVICE = 'INSERT INTO services (customer_id, service_name, charge) VALUES (?, ?, ?)'
+SQL_DELETE_SERVICE_RETURNING = 'DELETE FROM services WHERE id = ? RETURNING customer_id'
+# Fallback pair for SQLite libraries older than 3.35, which lack RETURNING
+SQL_SERVICE_CUSTOMER_ID = 'SELECT customer_id FROM services WHERE id = ?'
+SQL_DELETE_SERVICE = 'DELETE FROM services WHERE id = ?'
+# Completed with one placeholder per selected service id
+SQL_DELETE_CUSTOMER_SERVICES = 'DELETE FROM services WHERE customer_id = ? AND id IN ({})'
+
+# Ledger rows with their running balance computed by SQLite: services add up from zero,
+# payments count down from the customer's total charges (passed as the first parameter)
+SQL_LEDGER_SERVICES = (
+    'SELECT id, service_name, charge, created_at, SUM(charge) OVER (ORDER BY id) AS running_balance '
+    'FROM services WHERE customer_id = ? ORDER BY id'
+)
+SQL_LEDGER_PAYMENTS = (
+    'SELECT id, date, amount, ? - SUM(amount) OVER (ORDER BY date, id) AS running_balance '
+    'FROM payments WHERE customer_id = ? ORDER BY date, id'
+)
+SQL_PAYMENTS_FOR_CUSTOMER_DESC = 'SELECT id, date, amount FROM payments WHERE customer_id = ? ORDER BY date DESC'
+SQL_INSERT_PAYMENT = 'INSERT INTO payments (customer_id, date, amount) VALUES (?, ?, ?)'
+
+# Service catalog cache
+# The active catalog changes rarely, so it is loaded once and reused by /api/services
+# and the add_services dropdown. The catalog routes bump 'version' to drop it; the TTL
+# bounds how stale other worker processes (each with their own copy) can get.
+CATALOG_CACHE_TTL = 60  # seconds
+_catalog_cache = {'version': 0, 'rows': None, 'json': None, 'etag': None, 'loaded_at': 0.0}
+_catalog_lock = threading.Lock()
+
+def invalidate_catalog_cache():
+    """Drop the cached catalog after it has been modified"""
+    with _catalog_lock:
+        _catalog_cache['version'] += 1
+        _catalog_cache['rows'] = None
+        _catalog_cache['json'] = None
+        _catalog_cache['etag'] = None
+
+def get_active_catalog():
+    """Return the cached active catalog as a dict with 'rows', 'json' bytes and 'etag'"""
+    with _catalog_lock:
+        cached = dict(_catalog_cache)
+    if cached['rows'] is not None and time.monotonic() - cached['loaded_at'] < CATALOG_CACHE_TTL:
+        return cached
+    
+    rows = get_db().execute(SQL_CATALOG_ACTIVE).fetchall()
+    services = [dict(row) for row in rows]
+    if orjson is not None:
+        body = orjson.dumps(services)
+    else:
+        body = json.dumps(services, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    fresh = {
+        'rows': rows,
+        'json': body,
+        'etag': hashlib.md5(body).hexdigest(),
+        'loaded_at': time.monotonic(),
+    }
+    with _catalog_lock:
+        # Only store the result if nothing invalidated the cache while we were loading
+        if _catalog_cache['version'] == cached['version']:
+            _catalog_cache.update(fresh)
+    return fresh
+
+# Template events (text runs and expression outputs) rendered between writes when
+# streaming a page - a customer row is a few dozen events
+TEMPLATE_STREAM_BUFFER = 100
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed response, sent in chunks while it renders
+
+    The page head and stylesheet reach the browser while long customer lists are still
+    being rendered, instead of after the whole page has been built as one string.
+    """
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(TEMPLATE_STREAM_BUFFER)
+    return app.response_class(stream_with_context(stream), mimetype='text/html')
+
+# Form helpers
+def parse_amount(value, default=0.0):
+    """Convert a form amount to float so SQLite stores a REAL, not TEXT (None if invalid)"""
+    if value is None or not value.strip():
+        return default
+    try:
+        amount = float(value)
+    except ValueError:
+        return None
+    return amount if math.isfinite(amount) else None
 
 # Routes
 
 @app.route('/')
 def index():
-    """Home page - Display all customers"""
-    conn = get_db_connection()
-    customers = conn.execute('SELECT * FROM customers ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return render_template('index.html', customers=customers)
+    """Home page - Display customers, newest first, one page at a time"""
+    conn = get_db()
+    total_customers = conn.execute(SQL_COUNT_CUSTOMERS).fetchone()[0]
+    total_pages = max(1, math.ceil(total_customers / CUSTOMERS_PER_PAGE))
+    page = min(max(request.args.get('page', 1, type=int), 1), total_pages)
+    offset = (page - 1) * CUSTOMERS_PER_PAGE
+    
+    customers = conn.execute(SQL_CUSTOMERS_BY_NEWEST, (CUSTOMERS_PER_PAGE, offset)).fetchall()
+    return stream_page(
+        'index.html',
+        customers=customers,
+        total_customers=total_customers,
+        page=page,
+        total_pages=total_pages,
+        offset=offset
+    )
 
 @app.route('/add_customer', methods=['GET', 'POST'])
 def add_customer():
@@ -170,17 +537,19 @@ def add_customer():
         business_name = request.form.get('business_name', '')
         village = request.form.get('village', '')
         bank_name = request.form.get('bank_name', '')
-        loan_amount = request.form.get('loan_amount', 0)
+        loan_amount = parse_amount(request.form.get('loan_amount'))
         customer_date = request.form.get('customer_date', datetime.now().strftime('%Y-%m-%d'))
         
+        if loan_amount is None:
+            return "Invalid loan amount", 400
+        
         # Insert into database
-        conn = get_db_connection()
-        conn.execute(
-            'INSERT INTO customers (name, mobile, email, business_name, village, bank_name, loan_amount, customer_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-            (name, mobile, email, business_name, village, bank_name, loan_amount, customer_date)
-        )
-        conn.commit()
-        conn.close()
+        conn = get_db()
+        with conn:
+            conn.execute(
+                SQL_INSERT_CUSTOMER,
+                (name, mobile, email, business_name, village, bank_name, loan_amount, customer_date)
+            )
         
         return redirect(url_for('index'))
     
@@ -191,11 +560,8 @@ def add_customer():
 @app.route('/service_catalog')
 def service_catalog():
     """View and manage service catalog"""
-    conn = get_db_connection()
-    services = conn.execute(
-        'SELECT * FROM service_catalog ORDER BY service_name'
-    ).fetchall()
-    conn.close()
+    conn = get_db()
+    services = conn.execute(SQL_CATALOG_ALL).fetchall()
     return render_template('service_catalog.html', services=services)
 
 @app.route('/customer_catalog')
@@ -203,122 +569,127 @@ def customer_catalog():
     """View customer catalog with search capability"""
     search_query = request.args.get('search', '').strip()
     
-    conn = get_db_connection()
+    conn = get_db()
     if search_query:
         # Search by name or mobile (partial match)
         customers = conn.execute(
-            '''SELECT * FROM customers 
-               WHERE name LIKE ? OR mobile LIKE ? 
-               ORDER BY name''',
+            SQL_SEARCH_CUSTOMERS,
             (f'%{search_query}%', f'%{search_query}%')
         ).fetchall()
     else:
         # Show all customers
-        customers = conn.execute(
-            'SELECT * FROM customers ORDER BY name'
-        ).fetchall()
-    conn.close()
+        customers = conn.execute(SQL_CUSTOMERS_BY_NAME).fetchall()
     
-    return render_template('customer_catalog.html', customers=customers, search_query=search_query)
+    return stream_page('customer_catalog.html', customers=customers, search_query=search_query)
 
 @app.route('/service_catalog/add', methods=['POST'])
 def add_catalog_service():
     """Add new service to catalog"""
     service_name = request.form['service_name']
-    default_charge = request.form.get('default_charge', 0)
+    default_charge = parse_amount(request.form.get('default_charge'))
     
-    conn = get_db_connection()
+    if default_charge is None:
+        return "Invalid default charge", 400
+    
+    conn = get_db()
     try:
-        conn.execute(
-            'INSERT INTO service_catalog (service_name, default_charge) VALUES (?, ?)',
-            (service_name, default_charge)
-        )
-        conn.commit()
+        with conn:
+            conn.execute(
+                SQL_INSERT_CATALOG_SERVICE,
+                (service_name, default_charge)
+            )
     except sqlite3.IntegrityError:
         # Service already exists
         pass
-    finally:
-        conn.close()
+    invalidate_catalog_cache()
     
     return redirect(url_for('service_catalog'))
 
 @app.route('/service_catalog/edit/<int:service_id>', methods=['POST'])
 def edit_catalog_service(service_id):
     """Edit service in catalog"""
-    default_charge = request.form.get('default_charge', 0)
+    default_charge = parse_amount(request.form.get('default_charge'))
     is_active = request.form.get('is_active', 1)
     
-    conn = get_db_connection()
-    conn.execute(
-        'UPDATE service_catalog SET default_charge = ?, is_active = ? WHERE id = ?',
-        (default_charge, is_active, service_id)
-    )
-    conn.commit()
-    conn.close()
+    if default_charge is None:
+        return "Invalid default charge", 400
+    
+    conn = get_db()
+    with conn:
+        conn.execute(
+            SQL_UPDATE_CATALOG_SERVICE,
+            (default_charge, is_active, service_id)
+        )
+    invalidate_catalog_cache()
     
     return redirect(url_for('service_catalog'))
 
 @app.route('/api/services')
 def api_services():
     """JSON API to get all active services"""
-    conn = get_db_connection()
-    services = conn.execute(
-        'SELECT * FROM service_catalog WHERE is_active = 1 ORDER BY service_name'
-    ).fetchall()
-    conn.close()
+    catalog = get_active_catalog()
     
-    return jsonify([{
-        'id': s['id'],
-        'name': s['service_name'],
-        'charge': s['default_charge']
-    } for s in services])
+    # A client already holding this catalog gets an empty 304 without the JSON body being
+    # attached; everyone else gets the pre-serialized JSON
+    if request.if_none_match.contains_weak(catalog['etag']):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(catalog['json'], mimetype='application/json')
+    response.set_etag(catalog['etag'])
+    # Let the browser reuse its copy for as long as the server-side cache may be stale anyway
+    response.cache_control.private = True
+    response.cache_control.max_age = CATALOG_CACHE_TTL
+    return response
 
 @app.route('/add_services/<int:customer_id>', methods=['GET', 'POST'])
 def add_services(customer_id):
     """Add services for a customer"""
-    conn = get_db_connection()
+    conn = get_db()
     
     if request.method == 'POST':
         service_name = request.form['service_name']
-        charge = request.form.get('charge', 0)
+        charge = parse_amount(request.form.get('charge'))
+        
+        if charge is None:
+            return "Invalid charge amount", 400
         
         # Insert service
-        conn.execute(
-            'INSERT INTO services (customer_id, service_name, charge) VALUES (?, ?, ?)',
-            (customer_id, service_name, charge)
-        )
-        conn.commit()
+        with conn:
+            conn.execute(
+                SQL_INSERT_SERVICE,
+                (customer_id, service_name, charge)
+            )
         
         # Redirect back to the same page to add more services
         return redirect(url_for('add_services', customer_id=customer_id))
     
-    # Get customer info and existing services
-    customer = conn.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
-    services = conn.execute('SELECT * FROM services WHERE customer_id = ?', (customer_id,)).fetchall()
+    # Get customer info and existing services - the page total is the customer's
+    # trigger-maintained total_charges, read in the same snapshot as the rows
+    with read_transaction(conn):
+        customer = conn.execute(SQL_CUSTOMER_BY_ID, (customer_id,)).fetchone()
+        services = conn.execute(SQL_SERVICES_FOR_CUSTOMER, (customer_id,)).fetchall()
     
     # Get service catalog for dropdown
-    catalog_services = conn.execute(
-        'SELECT * FROM service_catalog WHERE is_active = 1 ORDER BY service_name'
-    ).fetchall()
-    
-    conn.close()
+    catalog_services = get_active_catalog()['rows']
     
     return render_template('add_services.html', customer=customer, services=services, catalog_services=catalog_services)
 
 @app.route('/delete_service/<int:service_id>', methods=['POST'])
 def delete_service(service_id):
     """Delete a service from customer's ledger"""
-    conn = get_db_connection()
+    conn = get_db()
     
-    # Get customer_id before deleting
-    service = conn.execute('SELECT customer_id FROM services WHERE id = ?', (service_id,)).fetchone()
+    # Delete the service and get its customer_id, in one statement where SQLite supports it
+    with conn:
+        if SQLITE_HAS_RETURNING:
+            service = conn.execute(SQL_DELETE_SERVICE_RETURNING, (service_id,)).fetchone()
+        else:
+            service = conn.execute(SQL_SERVICE_CUSTOMER_ID, (service_id,)).fetchone()
+            if service:
+                conn.execute(SQL_DELETE_SERVICE, (service_id,))
     
     if service:
         customer_id = service['customer_id']
-        # Delete the service
-        conn.execute('DELETE FROM services WHERE id = ?', (service_id,))
-        conn.commit()
-        conn.close()
         
         # Check referrer to redirect back to the correct page
         referrer = request.referrer or ''
@@ -327,7 +698,6 @@ def delete_service(service_id):
         else:
             return redirect(url_for('add_services', customer_id=customer_id))
     else:
-        conn.close()
         return "Service not found", 404
 
 @app.route('/delete_multiple_services/<int:customer_id>', methods=['POST'])
@@ -339,62 +709,65 @@ def delete_multiple_services(customer_id):
         # No services selected, redirect back
         return redirect(url_for('bill', customer_id=customer_id))
     
-    conn = get_db_connection()
-    
-    # Delete each selected service
-    for service_id in service_ids:
-        conn.execute('DELETE FROM services WHERE id = ? AND customer_id = ?', (service_id, customer_id))
-    
-    conn.commit()
-    conn.close()
+    conn = get_db()
     
+    # Delete all selected services with a single statement
+    placeholders = ','.join('?' * len(service_ids))
+    with conn:
+        conn.execute(
+            SQL_DELETE_CUSTOMER_SERVICES.format(placeholders),
+            [customer_id, *service_ids]
+        )
+
     # Redirect back to bill page
     return redirect(url_for('bill', customer_id=customer_id))
 
 @app.route('/delete_customer/<int:customer_id>', methods=['POST'])
 def delete_customer(customer_id):
     """Delete a customer and all associated services and payments"""
-    conn = get_db_connection()
+    conn = get_db()
     
     # Get customer name for confirmation message
-    customer = conn.execute('SELECT name FROM customers WHERE id = ?', (customer_id,)).fetchone()
+    customer = conn.execute(SQL_CUSTOMER_NAME_BY_ID, (customer_id,)).fetchone()
     
     if customer:
         # Delete the customer (CASCADE will delete associated services and payments)
-        conn.execute('DELETE FROM customers WHERE id = ?', (customer_id,))
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute(SQL_DELETE_CUSTOMER, (customer_id,))
         
         # Redirect to home page
         return redirect(url_for('index'))
     else:
-        conn.close()
         return "Customer not found", 404
 
 
 @app.route('/add_payment/<int:customer_id>', methods=['GET', 'POST'])
 def add_payment(customer_id):
     """Add payment for a customer"""
-    conn = get_db_connection()
+    conn = get_db()
     
     if request.method == 'POST':
         date = request.form['date']
-        amount = request.form['amount']
+        amount = parse_amount(request.form['amount'], default=None)
+        
+        if amount is None:
+            return "Invalid payment amount", 400
         
         # Insert payment
-        conn.execute(
-            'INSERT INTO payments (customer_id, date, amount) VALUES (?, ?, ?)',
-            (customer_id, date, amount)
-        )
-        conn.commit()
+        with conn:
+            conn.execute(
+                SQL_INSERT_PAYMENT,
+                (customer_id, date, amount)
+            )
         
         # Redirect back to the same page to add more payments
         return redirect(url_for('add_payment', customer_id=customer_id))
     
-    # Get customer info and existing payments
-    customer = conn.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
-    payments = conn.execute('SELECT * FROM payments WHERE customer_id = ? ORDER BY date DESC', (customer_id,)).fetchall()
-    conn.close()
+    # Get customer info and existing payments - the page total is the customer's
+    # trigger-maintained total_received, read in the same snapshot as the rows
+    with read_transaction(conn):
+        customer = conn.execute(SQL_CUSTOMER_BY_ID, (customer_id,)).fetchone()
+        payments = conn.execute(SQL_PAYMENTS_FOR_CUSTOMER_DESC, (customer_id,)).fetchall()
     
     # Get today's date for default value
     today = datetime.now().strftime('%Y-%m-%d')
@@ -404,23 +777,25 @@ def add_payment(customer_id):
 @app.route('/bill/<int:customer_id>')
 def bill(customer_id):
     """Generate and display bill for a customer"""
-    conn = get_db_connection()
-    
-    # Get customer details
-    customer = conn.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
-    
-    # Get all services
-    services = conn.execute('SELECT * FROM services WHERE customer_id = ?', (customer_id,)).fetchall()
-    
-    # Get all payments
-    payments = conn.execute('SELECT * FROM payments WHERE customer_id = ? ORDER BY date', (customer_id,)).fetchall()
-    
-    conn.close()
+    conn = get_db()
     
-    # Calculate totals
-    total_charges = sum(service['charge'] for service in services)
-    total_received = sum(payment['amount'] for payment in payments)
-    balance = total_charges - total_received
+    # Read the customer and the ledger in one transaction so the totals match the rows
+    with read_transaction(conn):
+        cursor = conn.cursor()
+        
+        # Get customer details - total_charges/total_received are kept current by triggers
+        customer = cursor.execute(SQL_CUSTOMER_BY_ID, (customer_id,)).fetchone()
+        if not customer:
+            return "Customer not found", 404
+        
+        total_charges = customer['total_charges']
+        total_received = customer['total_received']
+        # The totals are float sums, so round off leftover dust before the fully-paid check
+        balance = round(total_charges - total_received, 2)
+        
+        # Get all services and payments along with their running balances
+        services = cursor.execute(SQL_LEDGER_SERVICES, (customer_id,)).fetchall()
+        payments = cursor.execute(SQL_LEDGER_PAYMENTS, (total_charges, customer_id)).fetchall()
     
     # Get current date
     current_date = datetime.now().strftime('%d/%m/%Y')
@@ -439,93 +814,241 @@ def bill(customer_id):
 @app.route('/download_pdf/<int:customer_id>')
 def download_pdf(customer_id):
     """Generate and download PDF ledger for a customer"""
-    conn = get_db_connection()
-    
-    # Get customer details
-    customer = conn.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
-    
-    # Get all services
-    services = conn.execute('SELECT * FROM services WHERE customer_id = ?', (customer_id,)).fetchall()
-    
-    # Get all payments
-    payments = conn.execute('SELECT * FROM payments WHERE customer_id = ? ORDER BY date', (customer_id,)).fetchall()
-    
-    conn.close()
-    
-    # Calculate totals
-    total_charges = sum(service['charge'] for service in services)
-    total_received = sum(payment['amount'] for payment in payments)
-    balance = total_charges - total_received
-    
-    # Generate PDF
-    buffer = BytesIO()
-    pdf = generate_ledger_pdf(buffer, customer, services, payments, total_charges, total_received, balance)
-    buffer.seek(0)
+    conn = get_db()
+    
+    # Read the customer and the ledger in one transaction so the totals match the rows
+    with read_transaction(conn):
+        # Get customer details - total_charges/total_received are kept current by triggers
+        customer = conn.execute(SQL_CUSTOMER_BY_ID, (customer_id,)).fetchone()
+        if not customer:
+            return "Customer not found", 404
+        
+        total_charges = customer['total_charges']
+        total_received = customer['total_received']
+        # The totals are float sums, so round off leftover dust before the fully-paid check
+        balance = round(total_charges - total_received, 2)
+        
+        # Get all services and payments with their running balances, as plain tuples -
+        # the PDF only unpacks them by position. Rows are collected straight off the cursor
+        # into the tuples the PDF cache is keyed on, so no intermediate list is built.
+        cursor = tuple_cursor(conn)
+        services = tuple(cursor.execute(SQL_LEDGER_SERVICES, (customer_id,)))
+        payments = tuple(cursor.execute(SQL_LEDGER_PAYMENTS, (total_charges, customer_id)))
+    
+    # Generate PDF in a worker process, or reuse today's copy if the ledger is unchanged
+    today = datetime.now().strftime('%Y%m%d')
+    pdf_bytes, pdf_etag = cached_ledger_pdf(
+        tuple(dict(customer).items()),
+        services,
+        payments,
+        total_charges,
+        total_received,
+        balance,
+        today
+    )
     
     # Send PDF file
-    filename = f"Ledger_{customer['name'].replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
+    filename = f"Ledger_{customer['name'].replace(' ', '_')}_{today}.pdf"
+    # BytesIO shares the rendered bytes without copying and gives send_file a known size,
+    # so conditional=True can answer Range and If-None-Match requests. send_file streams
+    # the body out in blocks rather than handing the WSGI server one large string.
     return send_file(
-        buffer,
+        BytesIO(pdf_bytes),
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=filename
+        download_name=filename,
+        conditional=True,
+        etag=pdf_etag
     )
 
+# PDF colours, created once instead of on every ledger build
+COLOR_NAVY = colors.HexColor('#1F3A5F')
+COLOR_GOLD = colors.HexColor('#C9A227')
+COLOR_LIGHT = colors.HexColor('#F8F9FA')
+COLOR_GRID = colors.HexColor('#CCCCCC')
+COLOR_PAID_BG = colors.HexColor('#D4EDDA')
+COLOR_PAID_TEXT = colors.HexColor('#155724')
+COLOR_BALANCE_BG = colors.HexColor('#FFF3CD')
+COLOR_BALANCE_TEXT = colors.HexColor('#856404')
+COLOR_FOOTER_TEXT = colors.HexColor('#333333')
+COLOR_FOOTER_GRID = colors.HexColor('#E0E0E0')
+
+# PDF paragraph styles - immutable, so they are built once at import time
+SAMPLE_STYLES = getSampleStyleSheet()
+
+COMPANY_HEADER_STYLE = ParagraphStyle(
+    'CompanyHeader',
+    parent=SAMPLE_STYLES['Heading1'],
+    fontSize=24,
+    textColor=COLOR_NAVY,
+    spaceAfter=8,
+    alignment=TA_CENTER,
+    fontName='Helvetica-Bold'
+)
+
+COMPANY_SUBTITLE_STYLE = ParagraphStyle(
+    'CompanySubtitle',
+    parent=SAMPLE_STYLES['Normal'],
+    fontSize=10,
+    textColor=COLOR_GOLD,
+    spaceAfter=15,
+    alignment=TA_CENTER,
+    fontName='Helvetica-Bold'
+)
+
+LEDGER_TITLE_STYLE = ParagraphStyle(
+    'LedgerTitle',
+    parent=SAMPLE_STYLES['Heading1'],
+    fontSize=18,
+    textColor=COLOR_NAVY,
+    spaceAfter=15,
+    spaceBefore=5,
+    alignment=TA_CENTER,
+    fontName='Helvetica-Bold',
+    borderWidth=2,
+    borderColor=COLOR_GOLD,
+    borderPadding=8,
+    backColor=COLOR_LIGHT
+)
+
+SECTION_TITLE_STYLE = ParagraphStyle(
+    'SectionTitle',
+    parent=SAMPLE_STYLES['Heading2'],
+    fontSize=14,
+    textColor=COLOR_NAVY,
+    spaceAfter=10,
+    fontName='Helvetica-Bold'
+)
+
+BALANCE_STYLE = ParagraphStyle(
+    'BalanceStyle',
+    parent=SAMPLE_STYLES['Normal'],
+    fontSize=13,
+    fontName='Helvetica-Bold',
+    alignment=TA_CENTER,
+    textColor=COLOR_NAVY,
+)
+
+NOTE_STYLE = ParagraphStyle(
+    'NoteStyle',
+    parent=SAMPLE_STYLES['Italic'],
+    fontSize=9,
+    alignment=TA_CENTER,
+    textColor=colors.grey
+)
+
+FOOTER_TEXT_STYLE = ParagraphStyle(
+    'FooterText',
+    parent=SAMPLE_STYLES['Normal'],
+    fontSize=9,  # Increased from 8 for better readability
+    textColor=COLOR_FOOTER_TEXT,
+    leading=11
+)
+
+CUSTOMER_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), COLOR_NAVY),
+    ('BACKGROUND', (2, 0), (2, -1), COLOR_NAVY),
+    ('BACKGROUND', (1, 0), (1, -1), COLOR_LIGHT),
+    ('BACKGROUND', (3, 0), (3, -1), COLOR_LIGHT),
+    ('TEXTCOLOR', (0, 0), (0, -1), colors.white),
+    ('TEXTCOLOR', (2, 0), (2, -1), colors.white),
+    ('GRID', (0, 0), (-1, -1), 1, COLOR_NAVY),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+])
+
+# Ledger table commands shared by every ledger; row highlights are appended per build
+LEDGER_BASE_STYLE = (
+    # Header row styling
+    ('BACKGROUND', (0, 0), (-1, 0), COLOR_NAVY),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+    ('TOPPADDING', (0, 0), (-1, 0), 10),
+    ('GRID', (0, 0), (-1, -1), 1, COLOR_GRID),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 1), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+    # Alternate row colors for transactions
+    ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, COLOR_LIGHT]),
+)
+
+FOOTER_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), COLOR_LIGHT),
+    ('BOX', (0, 0), (-1, -1), 2, COLOR_GOLD),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 10),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, COLOR_FOOTER_GRID),
+])
+
+class LedgerDocTemplate(BaseDocTemplate):
+    """A4 ledger document with a single full-page frame
+
+    Same layout as SimpleDocTemplate, but the page template is fixed up front instead of
+    being rebuilt inside build(), so a ledger build only has to lay out its flowables.
+    Built with invariant=1 so the same ledger gives the same bytes in every worker: the
+    download ETag is a hash of the PDF, and ReportLab otherwise embeds a creation
+    timestamp and a random document ID.
+    """
+
+    def __init__(self, filename, **kw):
+        BaseDocTemplate.__init__(self, filename, pagesize=A4, rightMargin=30, leftMargin=30,
+                                 topMargin=20, bottomMargin=20, invariant=1, **kw)
+        # Frames track layout position while building, so each document gets its own
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+        self.addPageTemplates([PageTemplate(id='Ledger', frames=[frame], pagesize=A4)])
+
+@functools.lru_cache(maxsize=1)
+def static_pdf_paragraphs():
+    """Parse the fixed branding, note and footer paragraphs once per process"""
+    return {
+        'company_name': Paragraph("GOLD COIN CONSULTANCY FINANCE SERVICES", COMPANY_HEADER_STYLE),
+        'company_tagline': Paragraph("Professional Financial Consultancy", COMPANY_SUBTITLE_STYLE),
+        'title': Paragraph("LEDGER ACCOUNT", LEDGER_TITLE_STYLE),
+        'section_title': Paragraph("Transaction Ledger", SECTION_TITLE_STYLE),
+        'note': Paragraph("E. &amp; O.E. (Errors and Omissions Excepted)", NOTE_STYLE),
+        'footer_address': Paragraph("<b>Gold Coin Consultancy Finance Services</b><br/><font size=8>Laxmi Narayan Nivas Samor,<br/>Savarkar Nagar, Vita, Khanapur,<br/>Dist. Sangli - 415311</font>", FOOTER_TEXT_STYLE),
+        'footer_contacts': Paragraph("<b>Contact Numbers:</b><br/><font size=8>Ravikiran: +91 84216 24116<br/>Shriyash: +91 90216 74548</font>", FOOTER_TEXT_STYLE),
+        'footer_services': Paragraph("<b>Services Offered:</b><br/><font size=8>Personal Loan, Business Loan<br/>Mortgage Loan, Home Loan<br/>Vehicle Loan, CMEGP/PMEGP<br/>Annasaheb Patil Mahamandal Loans</font>", FOOTER_TEXT_STYLE),
+    }
+
+def fresh_static_paragraphs():
+    """Get per-build copies of the static paragraphs
+
+    Paragraphs store their wrapped layout on the instance, so every document gets its own
+    shallow copy. The parsed text fragments are shared, which skips re-parsing the markup.
+    """
+    return {name: copy.copy(paragraph) for name, paragraph in static_pdf_paragraphs().items()}
+
 def generate_ledger_pdf(buffer, customer, services, payments, total_charges, total_received, balance):
     """Generate professional PDF ledger with complete company branding"""
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=20, bottomMargin=20)
+    doc = LedgerDocTemplate(buffer)
     
     # Container for the 'Flowable' objects
     elements = []
-    
-    # Define styles
-    styles = getSampleStyleSheet()
+    static = fresh_static_paragraphs()
     
     # Company Header with Branding
-    company_header_style = ParagraphStyle(
-        'CompanyHeader',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1F3A5F'),
-        spaceAfter=8,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    company_subtitle_style = ParagraphStyle(
-        'CompanySubtitle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#C9A227'),
-        spaceAfter=15,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Add company branding
-    company_name = Paragraph("GOLD COIN CONSULTANCY FINANCE SERVICES", company_header_style)
-    elements.append(company_name)
-    company_tagline = Paragraph("Professional Financial Consultancy", company_subtitle_style)
-    elements.append(company_tagline)
+    elements.append(static['company_name'])
+    elements.append(static['company_tagline'])
     
     # Ledger title
-    ledger_title_style = ParagraphStyle(
-        'LedgerTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#1F3A5F'),
-        spaceAfter=15,
-        spaceBefore=5,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold',
-        borderWidth=2,
-        borderColor=colors.HexColor('#C9A227'),
-        borderPadding=8,
-        backColor=colors.HexColor('#F8F9FA')
-    )
-    
-    title = Paragraph("LEDGER ACCOUNT", ledger_title_style)
-    elements.append(title)
+    elements.append(static['title'])
     elements.append(Spacer(1, 15))
     
     # Customer info table with enhanced styling
@@ -544,52 +1067,23 @@ def generate_ledger_pdf(buffer, customer, services, payments, total_charges, tot
     
     # Adjust column widths based on number of rows
     customer_table = Table(customer_data, colWidths=[1.5*inch, 2.5*inch, 1.3*inch, 1.7*inch])
-    customer_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#1F3A5F')),
-        ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#1F3A5F')),
-        ('BACKGROUND', (1, 0), (1, -1), colors.HexColor('#F8F9FA')),
-        ('BACKGROUND', (3, 0), (3, -1), colors.HexColor('#F8F9FA')),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.white),
-        ('TEXTCOLOR', (2, 0), (2, -1), colors.white),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#1F3A5F')),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
+    customer_table.setStyle(CUSTOMER_TABLE_STYLE)
     
     elements.append(customer_table)
     elements.append(Spacer(1, 20))
     
     # Section title for ledger
-    section_style = ParagraphStyle(
-        'SectionTitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#1F3A5F'),
-        spaceAfter=10,
-        fontName='Helvetica-Bold'
-    )
-    section_title = Paragraph("Transaction Ledger", section_style)
-    elements.append(section_title)
+    elements.append(static['section_title'])
     
     # Ledger table with all transaction details
     ledger_data = [['Date', 'Particulars', 'Credit (Rs.)', 'Received (Rs.)', 'Balance (Rs.)']]
     
-    running_balance = 0
-    
     # Add services with dates
-    for service in services:
-        running_balance += service['charge']
-        date_str = service['created_at'][:10] if service['created_at'] else '-'
+    for _, service_name, charge, created_at, running_balance in services:
         ledger_data.append([
-            date_str,
-            service['service_name'],
-            f"{service['charge']:,.0f}",
+            created_at[:10] if created_at else '-',
+            service_name,
+            f"{charge:,.0f}",
             '-',
             f"{running_balance:,.0f}"
         ])
@@ -605,13 +1099,12 @@ def generate_ledger_pdf(buffer, customer, services, payments, total_charges, tot
         ])
     
     # Add payments
-    for payment in payments:
-        running_balance -= payment['amount']
+    for _, date, amount, running_balance in payments:
         ledger_data.append([
-            payment['date'],
+            date,
             'Payment Received',
             '-',
-            f"{payment['amount']:,.0f}",
+            f"{amount:,.0f}",
             f"{running_balance:,.0f}"
         ])
     
@@ -626,53 +1119,32 @@ def generate_ledger_pdf(buffer, customer, services, payments, total_charges, tot
     
     ledger_table = Table(ledger_data, colWidths=[1.1*inch, 2.8*inch, 1.3*inch, 1.3*inch, 1.5*inch])
     
-    # Style for ledger table
-    table_style = [
-        # Header row styling
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1F3A5F')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, 0), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#CCCCCC')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-        # Alternate row colors for transactions
-        ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#F8F9FA')]),
-    ]
+    # Style for ledger table - the shared base plus this ledger's row highlights
+    table_style = list(LEDGER_BASE_STYLE)
     
     # Highlight total charges row if services exist
     total_row_index = len(services) + 1 if services else 1
     if services:
         table_style.extend([
-            ('BACKGROUND', (0, total_row_index), (-1, total_row_index), colors.HexColor('#1F3A5F')),
+            ('BACKGROUND', (0, total_row_index), (-1, total_row_index), COLOR_NAVY),
             ('TEXTCOLOR', (0, total_row_index), (-1, total_row_index), colors.white),
             ('FONTNAME', (0, total_row_index), (-1, total_row_index), 'Helvetica-Bold'),
         ])
     
-    # Highlight payments in green
+    # Highlight payments in green - one range command covers every payment row
     payment_start = total_row_index + 1 if services else 1
     payment_end = payment_start + len(payments) - 1
     if payments:
-        for i in range(len(payments)):
-            row_idx = payment_start + i
-            table_style.extend([
-                ('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor('#D4EDDA')),
-                ('TEXTCOLOR', (0, row_idx), (-1, row_idx), colors.HexColor('#155724')),
-            ])
+        table_style.extend([
+            ('BACKGROUND', (0, payment_start), (-1, payment_end), COLOR_PAID_BG),
+            ('TEXTCOLOR', (0, payment_start), (-1, payment_end), COLOR_PAID_TEXT),
+        ])
     
     # Highlight final balance row
     balance_row_index = len(ledger_data) - 1
     table_style.extend([
-        ('BACKGROUND', (0, balance_row_index), (-1, balance_row_index), colors.HexColor('#FFF3CD')),
-        ('TEXTCOLOR', (0, balance_row_index), (-1, balance_row_index), colors.HexColor('#856404')),
+        ('BACKGROUND', (0, balance_row_index), (-1, balance_row_index), COLOR_BALANCE_BG),
+        ('TEXTCOLOR', (0, balance_row_index), (-1, balance_row_index), COLOR_BALANCE_TEXT),
         ('FONTNAME', (0, balance_row_index), (-1, balance_row_index), 'Helvetica-Bold'),
         ('FONTSIZE', (0, balance_row_index), (-1, balance_row_index), 11),
     ])
@@ -683,73 +1155,25 @@ def generate_ledger_pdf(buffer, customer, services, payments, total_charges, tot
     elements.append(Spacer(1, 20))
     
     # Balance summary text
-    balance_style = ParagraphStyle(
-        'BalanceStyle',
-        parent=styles['Normal'],
-        fontSize=13,
-        fontName='Helvetica-Bold',
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#1F3A5F'),
-    )
-    
     if balance == 0:
-        balance_text = Paragraph("ACCOUNT FULLY PAID - Balance: Rs. 0/-", balance_style)
+        balance_text = Paragraph("ACCOUNT FULLY PAID - Balance: Rs. 0/-", BALANCE_STYLE)
     else:
-        balance_text = Paragraph(f"Outstanding Balance: Rs. {balance:,.0f}/-", balance_style)
+        balance_text = Paragraph(f"Outstanding Balance: Rs. {balance:,.0f}/-", BALANCE_STYLE)
     
     elements.append(balance_text)
     elements.append(Spacer(1, 8))
     
     # Note
-    note_style = ParagraphStyle(
-        'NoteStyle',
-        parent=styles['Italic'],
-        fontSize=9,
-        alignment=TA_CENTER,
-        textColor=colors.grey
-    )
-    note = Paragraph("E. &amp; O.E. (Errors and Omissions Excepted)", note_style)
-    elements.append(note)
+    elements.append(static['note'])
     elements.append(Spacer(1, 20))
     
     # Company Footer with complete contact details
-    footer_title_style = ParagraphStyle(
-        'FooterTitle',
-        parent=styles['Normal'],
-        fontSize=11,
-        fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#1F3A5F'),
-        spaceAfter=5
-    )
-    
-    footer_text_style = ParagraphStyle(
-        'FooterText',
-        parent=styles['Normal'],
-        fontSize=9,  # Increased from 8 for better readability
-        textColor=colors.HexColor('#333333'),
-        leading=11
-    )
-    
-    # Company footer information
     footer_data = [
-        [
-            Paragraph("<b>Gold Coin Consultancy Finance Services</b><br/><font size=8>Laxmi Narayan Nivas Samor,<br/>Savarkar Nagar, Vita, Khanapur,<br/>Dist. Sangli - 415311</font>", footer_text_style),
-            Paragraph("<b>Contact Numbers:</b><br/><font size=8>Ravikiran: +91 84216 24116<br/>Shriyash: +91 90216 74548</font>", footer_text_style),
-            Paragraph("<b>Services Offered:</b><br/><font size=8>Personal Loan, Business Loan<br/>Mortgage Loan, Home Loan<br/>Vehicle Loan, CMEGP/PMEGP<br/>Annasaheb Patil Mahamandal Loans</font>", footer_text_style),
-        ]
+        [static['footer_address'], static['footer_contacts'], static['footer_services']]
     ]
     
     footer_table = Table(footer_data, colWidths=[2.5*inch, 2*inch, 3.5*inch])
-    footer_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F8F9FA')),
-        ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#C9A227')),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#E0E0E0')),
-    ]))
+    footer_table.setStyle(FOOTER_TABLE_STYLE)
     
     elements.append(footer_table)
     
@@ -758,11 +1182,106 @@ def generate_ledger_pdf(buffer, customer, services, payments, total_charges, tot
     
     return buffer
 
-if __name__ == '__main__':
-    # Initialize database if it doesn't exist
+# PDF rendering pool
+# ReportLab layout is pure Python and holds the GIL for the whole build, so ledgers are
+# rendered in separate worker processes and concurrent downloads don't block each other.
+# Every gunicorn worker gets its own pool and the processes stay resident, so the default
+# is kept small for low-memory hosts. PDF_WORKERS=0 renders inline, for platforms without
+# multiprocessing (e.g. serverless).
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', min(2, os.cpu_count() or 1)))
+# Start workers from a fork server rather than forking the threaded web worker, which can
+# leave the child holding locks that another thread had taken
+PDF_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def get_pdf_pool():
+    """Get the PDF worker pool, created on first use so it starts after gunicorn forks"""
+    global _pdf_pool, PDF_WORKERS
+    if _pdf_pool is None and PDF_WORKERS > 0:
+        with _pdf_pool_lock:
+            if _pdf_pool is None and PDF_WORKERS > 0:
+                try:
+                    _pdf_pool = ProcessPoolExecutor(
+                        max_workers=PDF_WORKERS,
+                        mp_context=multiprocessing.get_context(PDF_START_METHOD)
+                    )
+                except (OSError, NotImplementedError) as e:
+                    print(f"⚠️  PDF worker pool unavailable, rendering inline: {e}")
+                    PDF_WORKERS = 0
+    return _pdf_pool
+
+def render_ledger_pdf(customer, services, payments, total_charges, total_received, balance):
+    """Render the ledger PDF and return its bytes (runs inside a PDF worker process)"""
+    buffer = BytesIO()
+    generate_ledger_pdf(buffer, customer, services, payments, total_charges, total_received, balance)
+    return buffer.getvalue()
+
+def build_ledger_pdf(*args):
+    """Render a ledger PDF on the worker pool, falling back to the current process"""
+    global _pdf_pool
+    pool = get_pdf_pool()
+    if pool is not None:
+        try:
+            return pool.submit(render_ledger_pdf, *args).result()
+        except BrokenProcessPool:
+            # A worker died - drop the pool so the next request starts a fresh one
+            with _pdf_pool_lock:
+                if _pdf_pool is pool:
+                    _pdf_pool = None
+    return render_ledger_pdf(*args)
+
+# Ledger builds in progress, so concurrent requests for the same ledger (double clicks,
+# parallel Range requests from download managers) wait on one build instead of each
+# starting their own
+_pdf_builds = {}
+_pdf_builds_lock = threading.Lock()
+
+def build_ledger_pdf_once(key, *args):
+    """Render a ledger PDF, joining an identical build that is already running"""
+    with _pdf_builds_lock:
+        future = _pdf_builds.get(key)
+        owner = future is None
+        if owner:
+            future = _pdf_builds[key] = Future()
+    if not owner:
+        return future.result()
+    try:
+        pdf_bytes = build_ledger_pdf(*args)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(pdf_bytes)
+    finally:
+        with _pdf_builds_lock:
+            del _pdf_builds[key]
+    return pdf_bytes
+
+# Rendered ledgers keyed by everything printed on them, so repeat downloads skip ReportLab.
+# Adding or deleting a row changes the key, so entries never need invalidating.
+PDF_CACHE_SIZE = 256
+
+@functools.lru_cache(maxsize=PDF_CACHE_SIZE)
+def cached_ledger_pdf(customer_items, services, payments, total_charges, total_received, balance, day):
+    """Build a ledger PDF once per distinct ledger and day (the PDF prints today's date)
+
+    Returns the PDF bytes together with their ETag, so cache hits don't re-hash the file.
+    """
+    pdf_bytes = build_ledger_pdf_once(
+        (customer_items, services, payments, total_charges, total_received, balance, day),
+        dict(customer_items), services, payments, total_charges, total_received, balance
+    )
+    return pdf_bytes, hashlib.md5(pdf_bytes).hexdigest()
+
+# Initialize database if it doesn't exist - done at import time so that under
+# gunicorn --preload it runs once in the master process before workers fork.
+# PDF worker processes import this module too, but only to render, so they skip it.
+if multiprocessing.parent_process() is None:
     init_db()
-    
-    # Run the Flask app
+
+if __name__ == '__main__':
+    # Run the Flask development server (local use only - production runs under gunicorn)
     print("\n" + "="*50)
     print("🏢 Consultancy Billing & Ledger System")
     print("="*50)
@@ -11,6 +11,10 @@ CREATE TABLE IF NOT EXISTS customers (
     bank_name TEXT,
     loan_amount REAL DEFAULT 0,
     customer_date DATE,
+    business_name TEXT,
+    email TEXT,
+    total_charges REAL NOT NULL DEFAULT 0,   -- sum of services.charge, kept by triggers below
+    total_received REAL NOT NULL DEFAULT 0,  -- sum of payments.amount, kept by triggers below
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -48,10 +52,51 @@ CREATE TABLE IF NOT EXISTS payments (
 
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_services_customer ON services(customer_id);
-CREATE INDEX IF NOT EXISTS idx_payments_customer ON payments(customer_id);
+CREATE INDEX IF NOT EXISTS idx_payments_customer_date ON payments(customer_id, date);
 CREATE INDEX IF NOT EXISTS idx_service_catalog_active ON service_catalog(is_active);
 CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name);
 CREATE INDEX IF NOT EXISTS idx_customers_mobile ON customers(mobile);
+CREATE INDEX IF NOT EXISTS idx_customers_created_desc ON customers(created_at DESC, id DESC);
+
+-- Keep customers.total_charges / total_received in step with services and payments
+CREATE TRIGGER IF NOT EXISTS trg_services_insert AFTER INSERT ON services BEGIN
+    UPDATE customers SET total_charges = total_charges + NEW.charge WHERE id = NEW.customer_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_services_delete AFTER DELETE ON services BEGIN
+    UPDATE customers SET total_charges = total_charges - OLD.charge WHERE id = OLD.customer_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_services_update AFTER UPDATE OF charge, customer_id ON services BEGIN
+    UPDATE customers SET total_charges = total_charges - OLD.charge WHERE id = OLD.customer_id;
+    UPDATE customers SET total_charges = total_charges + NEW.charge WHERE id = NEW.customer_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_payments_insert AFTER INSERT ON payments BEGIN
+    UPDATE customers SET total_received = total_received + NEW.amount WHERE id = NEW.customer_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_payments_delete AFTER DELETE ON payments BEGIN
+    UPDATE customers SET total_received = total_received - OLD.amount WHERE id = OLD.customer_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_payments_update AFTER UPDATE OF amount, customer_id ON payments BEGIN
+    UPDATE customers SET total_received = total_received - OLD.amount WHERE id = OLD.customer_id;
+    UPDATE customers SET total_received = total_received + NEW.amount WHERE id = NEW.customer_id;
+END;
+
+-- Reject charges and payment amounts that aren't numbers
+CREATE TRIGGER IF NOT EXISTS trg_services_charge_insert BEFORE INSERT ON services
+WHEN typeof(NEW.charge) NOT IN ('real', 'integer') BEGIN
+    SELECT RAISE(ABORT, 'services.charge must be a number');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_services_charge_update BEFORE UPDATE OF charge ON services
+WHEN typeof(NEW.charge) NOT IN ('real', 'integer') BEGIN
+    SELECT RAISE(ABORT, 'services.charge must be a number');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_payments_amount_insert BEFORE INSERT ON payments
+WHEN typeof(NEW.amount) NOT IN ('real', 'integer') BEGIN
+    SELECT RAISE(ABORT, 'payments.amount must be a number');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_payments_amount_update BEFORE UPDATE OF amount ON payments
+WHEN typeof(NEW.amount) NOT IN ('real', 'integer') BEGIN
+    SELECT RAISE(ABORT, 'payments.amount must be a number');
+END;
 
 -- Insert predefined services into catalog
 -- These are the standard services offered by the consultancy
@@ -73,3 +118,7 @@ INSERT OR IGNORE INTO service_catalog (service_name, default_charge) VALUES
     ('Vendor Fee', 0),
     ('Dast Xerox', 0),
     ('Consultancy Charge (2%)', 0);
+
+-- Schema version (SCHEMA_VERSION in app.py) - this file already includes every migration,
+-- so init_db has nothing to apply to a database created from it
+PRAGMA user_version = 7;
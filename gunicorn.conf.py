@@ -0,0 +1,17 @@
+"""
+Gunicorn settings for production
+Picked up automatically when gunicorn is started from the project root: gunicorn app:app
+"""
+
+import os
+
+# Worker processes - WEB_CONCURRENCY overrides the default of two per CPU core
+workers = int(os.getenv('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1)))
+
+# Each worker serves requests on several threads; SQLite connections come from a
+# shared pool and PDFs render in separate processes, so threads don't block each other
+worker_class = 'gthread'
+threads = 4
+
+# Import the app once in the master (runs init_db) so workers share it copy-on-write
+preload_app = True